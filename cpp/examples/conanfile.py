@@ -1,3 +1,4 @@
+import shutil
 from conans import ConanFile, CMake
 
 
@@ -7,6 +8,8 @@ class FoxgloveWebSocketExamplesConan(ConanFile):
     requires = "foxglove-websocket/0.0.1"
 
     def build(self):
-        cmake = CMake(self)
+        cmake = CMake(self, generator="Ninja")
+        if shutil.which("ccache"):
+            cmake.definitions["CMAKE_CXX_COMPILER_LAUNCHER"] = "ccache"
         cmake.configure()
         cmake.build()
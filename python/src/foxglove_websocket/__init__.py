@@ -1,28 +1,53 @@
 import asyncio
 import signal
+import sys
 from typing import Any, Coroutine
 
+try:
+    import uvloop  # type: ignore
+except ImportError:
+    uvloop = None
 
-def run_cancellable(coro: Coroutine[None, None, Any]):
+
+def run_cancellable(coro: Coroutine[None, None, Any]) -> Any:
     """
     Run a coroutine such that a ctrl-C interrupt will gracefully cancel its
     execution and give it a chance to clean up before returning.
 
+    If uvloop is installed (`pip install foxglove-websocket[fast]`), it is used as the event loop.
+
     See also: https://www.roguelynn.com/words/asyncio-graceful-shutdowns/
     """
-    loop = asyncio.get_event_loop()
-    task = loop.create_task(coro)
-    try:
-        loop.add_signal_handler(signal.SIGINT, task.cancel)
-    except NotImplementedError:
-        # signal handlers are not available on Windows, KeyboardInterrupt will be raised instead
-        pass
+
+    async def run():
+        task = asyncio.current_task()
+        assert task is not None
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGINT, task.cancel)
+        except NotImplementedError:
+            # signal handlers are not available on Windows, KeyboardInterrupt will be raised instead
+            pass
+
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            pass
 
     try:
+        # On KeyboardInterrupt, the runner cancels the task and waits for it to finish cleaning up
+        # before re-raising.
+        if sys.version_info >= (3, 11):
+            loop_factory = uvloop.new_event_loop if uvloop is not None else None
+            with asyncio.Runner(loop_factory=loop_factory) as runner:
+                return runner.run(run())
+
+        if uvloop is None:
+            return asyncio.run(run())
+        previous_policy = asyncio.get_event_loop_policy()
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
         try:
-            loop.run_until_complete(task)
-        except KeyboardInterrupt:
-            task.cancel()
-            loop.run_until_complete(task)
-    except asyncio.CancelledError:
+            return asyncio.run(run())
+        finally:
+            asyncio.set_event_loop_policy(previous_policy)
+    except KeyboardInterrupt:
         pass
@@ -5,6 +5,20 @@ from foxglove_websocket import run_cancellable
 from foxglove_websocket.server import FoxgloveServer, FoxgloveServerListener
 from foxglove_websocket.types import ChannelId
 
+MESSAGE_SCHEMA = json.dumps(
+    {
+        "type": "object",
+        "properties": {
+            "msg": {"type": "string"},
+            "count": {"type": "number"},
+        },
+    }
+)
+
+# Only the count changes between messages, so format it into a pre-encoded template rather than
+# building and serializing a dict on every tick.
+MESSAGE_TEMPLATE = b'{"msg":"Hello!","count":%d}'
+
 
 async def main():
     class Listener(FoxgloveServerListener):
@@ -21,26 +35,22 @@ async def main():
                 "topic": "example_msg",
                 "encoding": "json",
                 "schemaName": "ExampleMsg",
-                "schema": json.dumps(
-                    {
-                        "type": "object",
-                        "properties": {
-                            "msg": {"type": "string"},
-                            "count": {"type": "number"},
-                        },
-                    }
-                ),
+                "schema": MESSAGE_SCHEMA,
             }
         )
 
+        # Publish against a fixed schedule, so send time doesn't slow the rate.
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
         i = 0
         while True:
             i += 1
-            await asyncio.sleep(0.2)
+            next_tick += 0.2
+            await asyncio.sleep(max(0, next_tick - loop.time()))
             await server.send_message(
                 chan_id,
                 time.time_ns(),
-                json.dumps({"msg": "Hello!", "count": i}).encode("utf8"),
+                MESSAGE_TEMPLATE % i,
             )
 
 
@@ -20,6 +20,7 @@ import os
 import sys
 import time
 from base64 import standard_b64encode
+from typing import Any
 from foxglove_websocket import run_cancellable
 from foxglove_websocket.server import FoxgloveServer, FoxgloveServerListener
 from foxglove_websocket.types import ChannelId
@@ -33,6 +34,13 @@ except ImportError as err:
     print(err)
     sys.exit(1)
 
+# Load the FileDescriptorSet, which was generated via `protoc --include_imports --descriptor_set_out`.
+# This is read once when the module is loaded, rather than with blocking file I/O on the event loop.
+with open(
+    os.path.join(os.path.dirname(ExampleMsg_pb2.__file__), "ExampleMsg.bin"), "rb"
+) as schema_bin:
+    SCHEMA_BASE64 = standard_b64encode(schema_bin.read()).decode("ascii")
+
 
 async def main():
     class Listener(FoxgloveServerListener):
@@ -42,12 +50,6 @@ async def main():
         def on_unsubscribe(self, server: FoxgloveServer, channel_id: ChannelId):
             print("Last client unsubscribed from", channel_id)
 
-    # Load the FileDescriptorSet, which was generated via `protoc --include_imports --descriptor_set_out`.
-    with open(
-        os.path.join(os.path.dirname(ExampleMsg_pb2.__file__), "ExampleMsg.bin"), "rb"
-    ) as schema_bin:
-        schema_base64 = standard_b64encode(schema_bin.read()).decode("ascii")
-
     async with FoxgloveServer("0.0.0.0", 8765, "example server") as server:
         server.set_listener(Listener())
         chan_id = await server.add_channel(
@@ -55,19 +57,22 @@ async def main():
                 "topic": "example_msg",
                 "encoding": "protobuf",
                 "schemaName": "ExampleMsg",  # Matches `message ExampleMsg` in ExampleMsg.proto
-                "schema": schema_base64,  # Represents the parsed contents of ExampleMsg.proto
+                "schema": SCHEMA_BASE64,  # Represents the parsed contents of ExampleMsg.proto
             }
         )
 
+        # Reuse a single message object, only updating the fields that change between messages.
+        msg: Any = ExampleMsg_pb2.ExampleMsg(msg="Hello!")  # type: ignore
+
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
         i = 0
         while True:
             i += 1
-            await asyncio.sleep(0.2)
-            await server.send_message(
-                chan_id,
-                time.time_ns(),
-                ExampleMsg_pb2.ExampleMsg(msg="Hello!", count=i).SerializeToString(),  # type: ignore
-            )
+            next_tick += 0.2
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+            msg.count = i
+            await server.send_message(chan_id, time.time_ns(), msg.SerializeToString())
 
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 import asyncio
+import collections
 import logging
-import concurrent.futures
-from typing import Any, Coroutine, Dict
+from typing import Deque, Dict, List, NamedTuple, Tuple, Union
 from foxglove_websocket import run_cancellable
 from foxglove_websocket.server import FoxgloveServer, FoxgloveServerListener
 from foxglove_websocket.types import ChannelId, ChannelWithoutId
@@ -18,6 +18,27 @@ handler.setFormatter(
 logger.addHandler(handler)
 
 
+class AddChannelEvent(NamedTuple):
+    id: MiddlewareChannelId
+    channel: ChannelWithoutId
+
+
+class RemoveChannelEvent(NamedTuple):
+    id: MiddlewareChannelId
+
+
+class MessageEvent(NamedTuple):
+    id: MiddlewareChannelId
+    timestamp: int
+    payload: bytes
+
+
+MiddlewareEvent = Union[AddChannelEvent, RemoveChannelEvent, MessageEvent]
+
+# The maximum number of middleware events to handle before yielding to the event loop.
+MAX_EVENTS_PER_YIELD = 64
+
+
 async def main():
     """
     This class illustrates how to make a Foxglove WebSocket server that interacts with a typical
@@ -28,16 +49,19 @@ async def main():
     runs the event loop). However, many frameworks -- such as those that interact with multiprocess
     pub/sub systems, drivers, or external hardware -- require the use of multiple threads. Luckily,
     it is possible to use the FoxgloveServer safely in a multi-threaded program as long as some
-    synchronization primitives are used. This example script demonstrates the use of
-    `asyncio.run_coroutine_threadsafe()` to manage threads (and if you look under the hood of the
+    synchronization primitives are used. This example script demonstrates the use of a thread-safe
+    queue and `loop.call_soon_threadsafe()` to manage threads (and if you look under the hood of the
     ExampleMiddlewareThread, you'll also see examples of `threading.Lock` and `threading.Event`).
 
     In this example, we run the FoxgloveServer in the main thread (see `run_cancellable(main())`),
     and start up the example middleware in a separate thread (`ExampleMiddlewareThread`). When the
     middleware has new channels or message data available, it invokes our callback functions
     (on_add_channel, on_remove_channel, on_message) in its own thread. To inform the FoxgloveServer
-    of these changes safely, we use `asyncio.run_coroutine_threadsafe()` to "hop" back over to the
-    main thread before calling methods on the server object.
+    of these changes safely, the callbacks append events to a queue, and a single loop running on
+    the main thread takes events off the queue and calls methods on the server object. Because
+    message data can arrive at a high rate, the middleware thread only "hops" over to the main
+    thread (with `loop.call_soon_threadsafe()`) to wake up that loop when it is idle, rather than
+    once per event.
     """
     middleware = ExampleMiddlewareThread()
     loop = asyncio.get_event_loop()
@@ -50,67 +74,108 @@ async def main():
         id_map: Dict[MiddlewareChannelId, ChannelId] = {}
         reverse_id_map: Dict[ChannelId, MiddlewareChannelId] = {}
 
-        # Configure callbacks that our middleware will call when channels are added or removed and
-        # when messages are received.
+        # Events from the middleware are appended to this queue from the middleware thread, and
+        # handled in order on the server thread by `process_events()` below. `deque.append()` and
+        # `deque.popleft()` are thread-safe, so no additional lock is needed here.
+        pending_events: Deque[MiddlewareEvent] = collections.deque()
+        has_events = asyncio.Event()
+        wakeup_scheduled = False
 
-        def run_coroutine_on_server_thread(coro: Coroutine[Any, Any, None]):
+        def push_event(event: MiddlewareEvent):
             """
-            The `run_coroutine_threadsafe()` function used below by default ignores exceptions
-            raised in the `handler()` coroutines. To log any errors to the console, we set an
-            exception-logging function as a done callback on the Future object returned by
-            `run_coroutine_threadsafe()`.
+            Queue an event from the middleware thread, waking up the server thread if needed.
             """
-
-            def log_exc(future: "concurrent.futures.Future[Any]"):
-                exc = future.exception()
-                if exc:
-                    logger.error(
-                        "Error in middleware handler:",
-                        exc_info=(type(exc), exc, exc.__traceback__),
+            nonlocal wakeup_scheduled
+            pending_events.append(event)
+            # Only hop over to the server thread if a wakeup isn't already on its way.
+            if not wakeup_scheduled:
+                wakeup_scheduled = True
+                loop.call_soon_threadsafe(has_events.set)
+
+        async def handle_channel_event(
+            event: Union[AddChannelEvent, RemoveChannelEvent]
+        ):
+            if isinstance(event, AddChannelEvent):
+                logger.info("Adding channel %d %s", event.id, event.channel["topic"])
+                ws_id = await server.add_channel(event.channel)
+                if event.id in id_map:
+                    raise Exception(
+                        f"Tried to add channel id {event.id} which already exists"
                     )
+                id_map[event.id] = ws_id
+                reverse_id_map[ws_id] = event.id
+            else:
+                logger.info("Removing channel %d", event.id)
+                ws_id = id_map.pop(event.id)
+                del reverse_id_map[ws_id]
+                await server.remove_channel(ws_id)
 
-            asyncio.run_coroutine_threadsafe(coro, loop).add_done_callback(log_exc)
+        async def process_events():
+            """
+            Handle queued middleware events on the server thread, in the order they were received.
+            Consecutive messages are sent to clients as a single batch.
+            """
+            nonlocal wakeup_scheduled
+            while True:
+                await has_events.wait()
+                has_events.clear()
+                # Reset the flag before draining, so any event queued after this point schedules
+                # another wakeup rather than being left behind.
+                wakeup_scheduled = False
+
+                batch: List[Tuple[ChannelId, int, bytes]] = []
+                events_since_yield = 0
+                while pending_events:
+                    event = pending_events.popleft()
+                    events_since_yield += 1
+                    try:
+                        if isinstance(event, MessageEvent):
+                            ws_id = id_map.get(event.id)
+                            # The channel may have been removed after the message was queued.
+                            if ws_id is not None:
+                                batch.append((ws_id, event.timestamp, event.payload))
+                            # Keep collecting while the next queued event is also a message.
+                            if (
+                                events_since_yield < MAX_EVENTS_PER_YIELD
+                                and pending_events
+                                and isinstance(pending_events[0], MessageEvent)
+                            ):
+                                continue
+                            if batch:
+                                to_send, batch = batch, []
+                                logger.debug("Sending %d messages", len(to_send))
+                                await server.send_messages(to_send)
+                        else:
+                            await handle_channel_event(event)
+                    except Exception:
+                        logger.exception("Error in middleware handler:")
+
+                    if events_since_yield >= MAX_EVENTS_PER_YIELD:
+                        # Let other tasks, such as the server's connection handlers, run before
+                        # handling more events, so a burst of middleware events can't starve them.
+                        events_since_yield = 0
+                        await asyncio.sleep(0)
+
+        # Configure callbacks that our middleware will call when channels are added or removed and
+        # when messages are received.
 
         def on_add_channel(id: MiddlewareChannelId, channel: ChannelWithoutId):
             """
             When the middleware notifies us a channel is added, add it to the WebSocket server.
             """
-
-            async def handler():
-                logger.info("Adding channel %d %s", id, channel["topic"])
-                ws_id = await server.add_channel(channel)
-                if id in id_map:
-                    raise Exception(
-                        f"Tried to add channel id {id} which already exists"
-                    )
-                id_map[id] = ws_id
-                reverse_id_map[ws_id] = id
-
-            run_coroutine_on_server_thread(handler())
+            push_event(AddChannelEvent(id, channel))
 
         def on_remove_channel(id: MiddlewareChannelId):
             """
             When the middleware notifies us a channel is removed, remove it from the WebSocket server.
             """
-
-            async def handler():
-                logger.info("Removing channel %d", id)
-                ws_id = id_map.pop(id)
-                del reverse_id_map[ws_id]
-                await server.remove_channel(ws_id)
-
-            run_coroutine_on_server_thread(handler())
+            push_event(RemoveChannelEvent(id))
 
         def on_message(id: MiddlewareChannelId, timestamp: int, payload: bytes):
             """
             When a message is received from the middleware, send it to clients via the WebSocket server.
             """
-
-            async def handler():
-                logger.info("Sending message on channel %d %d", id, timestamp)
-                await server.send_message(id_map[id], timestamp, payload)
-
-            run_coroutine_on_server_thread(handler())
+            push_event(MessageEvent(id, timestamp, payload))
 
         middleware.on_add_channel = on_add_channel
         middleware.on_remove_channel = on_remove_channel
@@ -140,16 +205,11 @@ async def main():
             # The middleware runs in its own, separate thread and calls our callbacks in that thread.
             middleware.start()
 
-            # On the main thread, we simply sleep forever (until canceled). This looks like it does
-            # nothing, but it actually yields control to the asyncio event loop so that it can
-            # continue processing tasks, such as those created by our `run_coroutine_threadsafe()`
-            # calls above, as well as internal tasks created by the FoxgloveServer, such as when
-            # data is received on the WebSocket.
-            #
-            # An alternative implementation of this function could use `asyncio.to_thread(...)`
-            # instead of the `threading.Thread` class to run the middleware thread, in which case we
-            # wouldn't need this additional dummy future.
-            await asyncio.Future()
+            # On the main thread, we handle events from the middleware forever (until canceled).
+            # Whenever this is waiting for new events, it yields control to the asyncio event loop
+            # so that it can continue processing other tasks, such as internal tasks created by the
+            # FoxgloveServer when data is received on the WebSocket.
+            await process_events()
         finally:
             # To shut down cleanly, we notify the middleware that the program is shutting down, and
             # then wait for the thread to terminate.
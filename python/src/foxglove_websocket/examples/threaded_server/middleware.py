@@ -3,7 +3,7 @@ import random
 import threading
 import time
 import logging
-from typing import Callable, Dict, FrozenSet, NewType
+from typing import Callable, Dict, List, NewType, Tuple
 from foxglove_websocket.types import ChannelWithoutId
 
 
@@ -18,6 +18,21 @@ logger.addHandler(handler)
 
 MiddlewareChannelId = NewType("MiddlewareChannelId", int)
 
+# Every channel in this example shares the same message layout, so the schema is only encoded once.
+MESSAGE_SCHEMA = json.dumps(
+    {
+        "type": "object",
+        "properties": {
+            "msg": {"type": "string"},
+            "value": {"type": "number"},
+        },
+    }
+)
+
+# Messages only differ in their channel id and value, so they are formatted into a pre-encoded
+# template rather than serialized from a dict each time.
+MESSAGE_TEMPLATE = b'{"msg":"Hello channel %d","value":%d}'
+
 
 class ExampleMiddlewareThread(threading.Thread):
     """
@@ -40,19 +55,20 @@ class ExampleMiddlewareThread(threading.Thread):
     # thread). This lock is used to manage the set of subscribed channels safely across multiple
     # threads.
     #
-    # We use a frozenset to indicate that we won't mutate the data structure, we'll just replace it
+    # We use a tuple to indicate that we won't mutate the data structure, we'll just replace it
     # when subscriptions change. This allows the thread's main loop to briefly acquire the lock,
-    # grab a reference to the set of channels, and release the lock, knowing that the referenced set
-    # is safe to use from the thread, even if another thread happens to replace it.
+    # grab a reference to the tuple of channels, and release the lock, knowing that the referenced
+    # tuple is safe to use from the thread, even if another thread happens to replace it. A tuple
+    # (rather than a frozenset) also lets the main loop pick a random channel by index.
     _lock: threading.Lock
-    _subscribed_channels: FrozenSet[MiddlewareChannelId]
+    _subscribed_channels: Tuple[MiddlewareChannelId, ...]
 
     def __init__(self):
         super().__init__()
         self._stop_event = threading.Event()
         self._lock = threading.Lock()
         self._stopped = False
-        self._subscribed_channels = frozenset()
+        self._subscribed_channels = ()
 
     def handle_subscribe_threadsafe(self, chan: MiddlewareChannelId):
         """
@@ -61,7 +77,8 @@ class ExampleMiddlewareThread(threading.Thread):
         thread.
         """
         with self._lock:
-            self._subscribed_channels = self._subscribed_channels | {chan}
+            if chan not in self._subscribed_channels:
+                self._subscribed_channels += (chan,)
 
     def handle_unsubscribe_threadsafe(self, chan: MiddlewareChannelId):
         """
@@ -69,8 +86,13 @@ class ExampleMiddlewareThread(threading.Thread):
         uses a lock to access internal data structures. It will be called on the WebSocket server
         thread.
         """
+        self._remove_subscribed_channel(chan)
+
+    def _remove_subscribed_channel(self, chan: MiddlewareChannelId):
         with self._lock:
-            self._subscribed_channels = self._subscribed_channels - {chan}
+            self._subscribed_channels = tuple(
+                c for c in self._subscribed_channels if c != chan
+            )
 
     def stop_threadsafe(self):
         """
@@ -93,6 +115,8 @@ class ExampleMiddlewareThread(threading.Thread):
 
         # Last value published on each channel
         active_channels: Dict[MiddlewareChannelId, int] = {}
+        # The same channel ids in a list, so that a random one can be picked without copying them
+        active_channel_ids: List[MiddlewareChannelId] = []
 
         def next_channel_id() -> MiddlewareChannelId:
             """
@@ -108,8 +132,8 @@ class ExampleMiddlewareThread(threading.Thread):
             # Take a reference to the current set of subscribed channels. Because this internal
             # state may be accessed from multiple threads, we need to hold the lock while we access
             # it. Once we release the lock, we know it's safe to continue using the reference during
-            # the rest of the loop because the set is never mutated by another thread -- it's only
-            # ever replaced with a completely new set.
+            # the rest of the loop because the tuple is never mutated by another thread -- it's only
+            # ever replaced with a completely new tuple.
             with self._lock:
                 subscribed_channels = self._subscribed_channels
 
@@ -123,41 +147,31 @@ class ExampleMiddlewareThread(threading.Thread):
                         "topic": f"topic_{id}",
                         "encoding": "json",
                         "schemaName": f"ExampleMsg{id}",
-                        "schema": json.dumps(
-                            {
-                                "type": "object",
-                                "properties": {
-                                    "msg": {"type": "string"},
-                                    "value": {"type": "number"},
-                                },
-                            }
-                        ),
+                        "schema": MESSAGE_SCHEMA,
                     },
                 )
                 active_channels[id] = 0
+                active_channel_ids.append(id)
 
             elif random_action < 0.1:
                 # Remove a random channel
-                channel_id = random.choice(list(active_channels.keys()))
+                index = random.randrange(len(active_channel_ids))
+                channel_id = active_channel_ids[index]
+                # Move the last id into the removed slot, so removal doesn't shift the whole list.
+                active_channel_ids[index] = active_channel_ids[-1]
+                active_channel_ids.pop()
                 self.on_remove_channel(channel_id)
                 del active_channels[channel_id]
-                with self._lock:
-                    # Remove the channel from subscribed_channels so we don't try to publish a message to it.
-                    self._subscribed_channels = self._subscribed_channels - {channel_id}
+                # Remove the channel from subscribed_channels so we don't try to publish a message to it.
+                self._remove_subscribed_channel(channel_id)
 
             elif subscribed_channels:
                 # Send a message on a random subscribed channel
-                chan = random.choice(list(subscribed_channels))
+                chan = random.choice(subscribed_channels)
                 now = time.time_ns()
                 value = active_channels[chan]
                 active_channels[chan] += 1
-                self.on_message(
-                    chan,
-                    now,
-                    json.dumps({"msg": f"Hello channel {chan}", "value": value}).encode(
-                        "utf8"
-                    ),
-                )
+                self.on_message(chan, now, MESSAGE_TEMPLATE % (chan, value))
 
         # Clean up channels when shutting down
         for id in active_channels:
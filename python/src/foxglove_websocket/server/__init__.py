@@ -1,13 +1,31 @@
 from abc import ABC, abstractmethod
 import asyncio
+from collections import defaultdict
 import json
 import logging
 from struct import Struct
-from typing import Any, Dict, Optional, Tuple, cast
+from typing import (
+    Any,
+    Awaitable,
+    DefaultDict,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
 from websockets.server import serve, WebSocketServer, WebSocketServerProtocol
 from websockets.exceptions import ConnectionClosed
 from websockets.typing import Data, Subprotocol
 
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
 from .client_state import ClientState
 from ..types import (
     BinaryOpcode,
@@ -32,6 +50,22 @@ def _get_default_logger():
 
 MessageDataHeader = Struct("<BIQ")
 
+# Message payloads may be any bytes-like object.
+MessagePayload = Union[bytes, bytearray, memoryview]
+
+
+def _encode_json(msg: ServerMessage) -> str:
+    # Server messages are sent as text frames, so orjson's bytes output is decoded back to a str.
+    if orjson is not None:
+        return orjson.dumps(msg).decode("utf8")
+    return json.dumps(msg, separators=(",", ":"))
+
+
+def _decode_json(data: str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
 class FoxgloveServerListener(ABC):
     @abstractmethod
@@ -50,12 +84,15 @@ class FoxgloveServerListener(ABC):
 
 
 class FoxgloveServer:
-    _clients: Tuple[ClientState, ...]
+    _clients: Set[ClientState]
+    _subscribed_clients: DefaultDict[ChannelId, Set[ClientState]]
     _channels: Dict[ChannelId, Channel]
+    _advertise_json: Optional[str]
     _next_channel_id: ChannelId
     _logger: logging.Logger
     _listener: Optional[FoxgloveServerListener]
     _opened: "asyncio.Future[WebSocketServer]"
+    _compression: Optional[str]
 
     def __init__(
         self,
@@ -64,12 +101,20 @@ class FoxgloveServer:
         name: str,
         *,
         logger: logging.Logger = _get_default_logger(),
+        compression: Optional[str] = "deflate",
     ):
+        """
+        `compression` selects the WebSocket compression extension offered to clients; pass `None`
+        to disable per-message deflate, for example when channels carry already-compressed data.
+        """
         self.host = host
         self.port = port
         self.name = name
-        self._clients = ()
+        self._compression = compression
+        self._clients = set()
+        self._subscribed_clients = defaultdict(set)
         self._channels = {}
+        self._advertise_json = None
         self._next_channel_id = ChannelId(0)
         self._logger = logger
         self._listener = None
@@ -78,10 +123,18 @@ class FoxgloveServer:
     def set_listener(self, listener: FoxgloveServerListener):
         self._listener = listener
 
-    def _any_subscribed(self, chan_id: ChannelId):
-        return any(
-            chan_id in client.subscriptions_by_channel for client in self._clients
-        )
+    def _remove_subscribed_client(self, chan_id: ChannelId, client: ClientState):
+        """
+        Remove `client` from the subscribers of `chan_id`. Returns True if it was the last one.
+        """
+        clients = self._subscribed_clients.get(chan_id)
+        if clients is None:
+            return False
+        clients.discard(client)
+        if clients:
+            return False
+        del self._subscribed_clients[chan_id]
+        return True
 
     async def __aenter__(self):
         self.start()
@@ -116,6 +169,7 @@ class FoxgloveServer:
                 self.host,
                 self.port,
                 subprotocols=[Subprotocol("foxglove.websocket.v1")],
+                compression=self._compression,
             )
             self._opened.set_result(server)
         except asyncio.CancelledError:
@@ -136,64 +190,116 @@ class FoxgloveServer:
         self._next_channel_id = ChannelId(new_id + 1)
         new_channel = Channel(id=new_id, **channel)
         self._channels[new_id] = new_channel
+        self._advertise_json = None
         # Any clients added during await will already see the new channel.
-        for client in self._clients:
-            await self._send_json(
-                client.connection,
-                {
-                    "op": "advertise",
-                    "channels": [new_channel],
-                },
-            )
+        await self._broadcast_json({"op": "advertise", "channels": [new_channel]})
         return new_id
 
     async def remove_channel(self, chan_id: ChannelId):
         del self._channels[chan_id]
-        # Any clients added during await will not have received info about the new channel.
+        self._advertise_json = None
+        self._subscribed_clients.pop(chan_id, None)
         for client in self._clients:
             client.remove_channel(chan_id)
+        # Any clients added during await will not have received info about the new channel.
+        await self._broadcast_json({"op": "unadvertise", "channelIds": [chan_id]})
 
-            await self._send_json(
-                client.connection,
-                {
-                    "op": "unadvertise",
-                    "channelIds": [chan_id],
-                },
-            )
-
-    async def send_message(self, chan_id: ChannelId, timestamp: int, payload: bytes):
-        for client in self._clients:
+    async def send_message(
+        self, chan_id: ChannelId, timestamp: int, payload: MessagePayload
+    ):
+        """
+        Send a message to all clients subscribed to `chan_id`. The payload may be any bytes-like
+        object (such as a memoryview over a middleware-owned buffer); it is handed to each
+        connection as-is, and is not converted to `bytes` by the server.
+        """
+        # Clients typically number their subscriptions starting from 0, so several clients often
+        # share the same header. Pack each distinct header only once.
+        headers: Dict[SubscriptionId, bytes] = {}
+        sends: List[Awaitable[None]] = []
+        for client in self._subscribed_clients.get(chan_id, ()):
             subs = client.subscriptions_by_channel.get(chan_id, ())
             for sub_id in subs:
-                await self._send_message_data(
-                    client.connection,
-                    subscription=sub_id,
-                    timestamp=timestamp,
-                    payload=payload,
+                header = headers.get(sub_id)
+                if header is None:
+                    header = headers[sub_id] = MessageDataHeader.pack(
+                        BinaryOpcode.MESSAGE_DATA, sub_id, timestamp
+                    )
+                sends.append(
+                    self._send_message_data(client.connection, header, payload)
                 )
+        # Send to clients concurrently, so that one slow client doesn't hold up the others.
+        if sends:
+            await asyncio.gather(*sends)
+
+    async def send_messages(
+        self, messages: Iterable[Tuple[ChannelId, int, MessagePayload]]
+    ):
+        """
+        Send a batch of `(chan_id, timestamp, payload)` messages. Each client's subscriptions are
+        looked up once for the whole batch, and messages are delivered to each client in order.
+        Payloads may be any bytes-like object, as in `send_message`.
+        """
+        batch = list(messages)
+        headers: Dict[Tuple[SubscriptionId, int], bytes] = {}
+        sends: List[Awaitable[None]] = []
+        clients: Set[ClientState] = set()
+        for chan_id, _, _ in batch:
+            clients.update(self._subscribed_clients.get(chan_id, ()))
+        for client in clients:
+            subs_by_channel = client.subscriptions_by_channel
+            frames: List[Tuple[bytes, MessagePayload]] = []
+            for chan_id, timestamp, payload in batch:
+                for sub_id in subs_by_channel.get(chan_id, ()):
+                    header = headers.get((sub_id, timestamp))
+                    if header is None:
+                        header = headers[sub_id, timestamp] = MessageDataHeader.pack(
+                            BinaryOpcode.MESSAGE_DATA, sub_id, timestamp
+                        )
+                    frames.append((header, payload))
+            if frames:
+                sends.append(self._send_message_frames(client.connection, frames))
+        # Clients are sent to concurrently, while each client's messages stay in order.
+        if sends:
+            await asyncio.gather(*sends)
+
+    async def _broadcast_json(self, msg: ServerMessage):
+        """
+        Send the same message to all connected clients, encoding it only once.
+        """
+        text = _encode_json(msg)
+        # Iterate over a snapshot, since clients may connect or disconnect during await.
+        for client in tuple(self._clients):
+            await self._send_text(client.connection, text)
 
     async def _send_json(self, connection: WebSocketServerProtocol, msg: ServerMessage):
+        await self._send_text(connection, _encode_json(msg))
+
+    async def _send_text(self, connection: WebSocketServerProtocol, text: str):
         try:
-            await connection.send(json.dumps(msg, separators=(",", ":")))
+            await connection.send(text)
         except ConnectionClosed:
             pass
 
     async def _send_message_data(
         self,
         connection: WebSocketServerProtocol,
-        *,
-        subscription: SubscriptionId,
-        timestamp: int,
-        payload: bytes,
+        header: bytes,
+        payload: MessagePayload,
     ):
         try:
-            header = MessageDataHeader.pack(
-                BinaryOpcode.MESSAGE_DATA, subscription, timestamp
-            )
-            await connection.send([header, payload])
+            # websockets 10 accepts bytearray and memoryview payloads at runtime.
+            await connection.send(cast(List[Data], [header, payload]))
         except ConnectionClosed:
             pass
 
+    async def _send_message_frames(
+        self,
+        connection: WebSocketServerProtocol,
+        frames: List[Tuple[bytes, MessagePayload]],
+    ):
+        for header, payload in frames:
+            await self._send_message_data(connection, header, payload)
+
     async def _handle_connection(
         self, connection: WebSocketServerProtocol, path: str
     ) -> None:
@@ -202,7 +308,7 @@ class FoxgloveServer:
         )
 
         client = ClientState(connection=connection)
-        self._clients += (client,)
+        self._clients.add(client)
 
         try:
             await self._send_json(
@@ -213,13 +319,13 @@ class FoxgloveServer:
                     "capabilities": [],
                 },
             )
-            await self._send_json(
-                connection,
-                {
-                    "op": "advertise",
-                    "channels": list(self._channels.values()),
-                },
-            )
+            # Every new client receives the same advertisement of all channels, so it is only
+            # re-encoded after the set of channels changes.
+            if self._advertise_json is None:
+                self._advertise_json = _encode_json(
+                    {"op": "advertise", "channels": list(self._channels.values())}
+                )
+            await self._send_text(connection, self._advertise_json)
             async for raw_message in connection:
                 await self._handle_raw_client_message(client, raw_message)
 
@@ -238,12 +344,11 @@ class FoxgloveServer:
             await connection.close(1011)  # Internal Error
 
         finally:
-            potential_unsubscribes = client.subscriptions_by_channel.keys()
-            self._clients = tuple(c for c in self._clients if c != client)
-            if self._listener:
-                for chan_id in potential_unsubscribes:
-                    if not self._any_subscribed(chan_id):
-                        self._listener.on_unsubscribe(self, chan_id)
+            self._clients.discard(client)
+            for chan_id in client.subscriptions_by_channel:
+                last_subscriber = self._remove_subscribed_client(chan_id, client)
+                if self._listener and last_subscriber:
+                    self._listener.on_unsubscribe(self, chan_id)
 
     async def _handle_raw_client_message(self, client: ClientState, raw_message: Data):
         try:
@@ -251,7 +356,7 @@ class FoxgloveServer:
                 raise TypeError(
                     f"Expected text message, got {type(raw_message)} (first byte: {next(iter(raw_message), None)})"
                 )
-            message = json.loads(raw_message)
+            message = _decode_json(raw_message)
             self._logger.debug("Got message: %s", message)
             if not isinstance(message, dict):
                 raise TypeError(f"Expected JSON object, got {type(message)}")
@@ -270,60 +375,74 @@ class FoxgloveServer:
             )
 
     async def _handle_client_message(self, client: ClientState, message: ClientMessage):
-        if message["op"] == "subscribe":
-            for sub in message["subscriptions"]:
-                chan_id = sub["channelId"]
-                sub_id = sub["id"]
-                if sub_id in client.subscriptions:
-                    await self._send_json(
-                        client.connection,
-                        {
-                            "op": "status",
-                            "level": StatusLevel.ERROR,
-                            "message": f"Client subscription id {sub_id} was already used; ignoring subscription",
-                        },
+        # Problems with individual subscriptions are collected and reported to the client in one
+        # status message per level, rather than one message per subscription.
+        errors: List[str] = []
+        warnings: List[str] = []
+        try:
+            if message["op"] == "subscribe":
+                for sub in message["subscriptions"]:
+                    chan_id = sub["channelId"]
+                    sub_id = sub["id"]
+                    if sub_id in client.subscriptions:
+                        errors.append(
+                            f"Client subscription id {sub_id} was already used; ignoring subscription"
+                        )
+                        continue
+                    chan = self._channels.get(chan_id)
+                    if chan is None:
+                        warnings.append(
+                            f"Channel {chan_id} is not available; ignoring subscription"
+                        )
+                        continue
+                    self._logger.debug(
+                        "Client %s subscribed to channel %s",
+                        client.connection.remote_address,
+                        chan_id,
                     )
-                    continue
-                chan = self._channels.get(chan_id)
-                if chan is None:
-                    await self._send_json(
-                        client.connection,
-                        {
-                            "op": "status",
-                            "level": StatusLevel.WARNING,
-                            "message": f"Channel {chan_id} is not available; ignoring subscription",
-                        },
+                    first_subscription = chan_id not in self._subscribed_clients
+                    client.add_subscription(sub_id, chan_id)
+                    self._subscribed_clients[chan_id].add(client)
+                    if self._listener and first_subscription:
+                        self._listener.on_subscribe(self, chan_id)
+
+            elif message["op"] == "unsubscribe":
+                for sub_id in message["subscriptionIds"]:
+                    chan_id = client.remove_subscription(sub_id)
+                    if chan_id is None:
+                        warnings.append(
+                            f"Client subscription id {sub_id} did not exist; ignoring unsubscription"
+                        )
+                        continue
+                    self._logger.debug(
+                        "Client %s unsubscribed from channel %s",
+                        client.connection.remote_address,
+                        chan_id,
                     )
-                    continue
-                self._logger.debug(
-                    "Client %s subscribed to channel %s",
-                    client.connection.remote_address,
-                    chan_id,
-                )
-                first_subscription = not self._any_subscribed(chan_id)
-                client.add_subscription(sub_id, chan_id)
-                if self._listener and first_subscription:
-                    self._listener.on_subscribe(self, chan_id)
-
-        elif message["op"] == "unsubscribe":
-            for sub_id in message["subscriptionIds"]:
-                chan_id = client.remove_subscription(sub_id)
-                if chan_id is None:
-                    await self._send_json(
-                        client.connection,
-                        {
-                            "op": "status",
-                            "level": StatusLevel.WARNING,
-                            "message": f"Client subscription id {sub_id} did not exist; ignoring unsubscription",
-                        },
-                    )
-                    continue
-                self._logger.debug(
-                    "Client %s unsubscribed from channel %s",
-                    client.connection.remote_address,
-                    chan_id,
-                )
-                if self._listener and not self._any_subscribed(chan_id):
-                    self._listener.on_unsubscribe(self, chan_id)
-        else:
-            raise ValueError(f"Unrecognized client opcode: {message['op']}")
+                    if chan_id in client.subscriptions_by_channel:
+                        # The client still has other subscriptions to this channel.
+                        continue
+                    last_subscriber = self._remove_subscribed_client(chan_id, client)
+                    if self._listener and last_subscriber:
+                        self._listener.on_unsubscribe(self, chan_id)
+            else:
+                raise ValueError(f"Unrecognized client opcode: {message['op']}")
+        finally:
+            # Report problems found before any exception, which is reported separately.
+            await self._send_status(client.connection, StatusLevel.ERROR, errors)
+            await self._send_status(client.connection, StatusLevel.WARNING, warnings)
+
+    async def _send_status(
+        self,
+        connection: WebSocketServerProtocol,
+        level: StatusLevel,
+        messages: List[str],
+    ):
+        """
+        Send `messages` to a client as a single status message, one per line.
+        """
+        if messages:
+            await self._send_json(
+                connection,
+                {"op": "status", "level": level, "message": "\n".join(messages)},
+            )
@@ -1,81 +1,49 @@
-from types import MappingProxyType
-from typing import Optional, Iterable
-from dataclasses import field
+from collections import defaultdict
+from typing import DefaultDict, Dict, Optional, Set
 from websockets.server import WebSocketServerProtocol
-from dataclasses import dataclass
 
 from ..types import ChannelId, SubscriptionId
 
 
-@dataclass
 class ClientState:
     """
     ClientState holds information about subscriptions from a given client, used by the server for
-    bookkeeping. The `subscriptions` and `subscriptions_by_channel` are immutable, which makes them
-    safe to use in concurrent (async) code without worrying that they will be mutated during
-    iteration.
+    bookkeeping. The `subscriptions` and `subscriptions_by_channel` are updated in place, so callers
+    must not await while iterating over them (or must iterate over a copy), since the client's
+    subscriptions may change while another task is running.
+
+    Instances compare by identity, so they can be stored in sets.
     """
 
+    __slots__ = ("connection", "subscriptions", "subscriptions_by_channel")
+
     connection: WebSocketServerProtocol
-    subscriptions: "MappingProxyType[SubscriptionId, ChannelId]" = field(
-        default_factory=lambda: MappingProxyType({})
-    )
-    subscriptions_by_channel: "MappingProxyType[ChannelId, Iterable[SubscriptionId]]" = field(
-        default_factory=lambda: MappingProxyType({})
-    )
+    subscriptions: Dict[SubscriptionId, ChannelId]
+    subscriptions_by_channel: DefaultDict[ChannelId, Set[SubscriptionId]]
+
+    def __init__(self, connection: WebSocketServerProtocol):
+        self.connection = connection
+        self.subscriptions = {}
+        self.subscriptions_by_channel = defaultdict(set)
 
     def remove_channel(self, removed_chan_id: ChannelId):
-        subs = self.subscriptions_by_channel.get(removed_chan_id)
+        subs = self.subscriptions_by_channel.pop(removed_chan_id, None)
         if subs is not None:
-            self.subscriptions = MappingProxyType(
-                {
-                    sub: chan
-                    for sub, chan in self.subscriptions.items()
-                    if chan != removed_chan_id
-                }
-            )
-            self.subscriptions_by_channel = MappingProxyType(
-                {
-                    chan: subs
-                    for chan, subs in self.subscriptions_by_channel.items()
-                    if chan != removed_chan_id
-                }
-            )
+            for sub_id in subs:
+                del self.subscriptions[sub_id]
 
     def add_subscription(self, sub_id: SubscriptionId, chan_id: ChannelId):
-        self.subscriptions = MappingProxyType({**self.subscriptions, sub_id: chan_id})
-        self.subscriptions_by_channel = MappingProxyType(
-            {
-                **self.subscriptions_by_channel,
-                chan_id: {*self.subscriptions_by_channel.get(chan_id, ()), sub_id},
-            }
-        )
+        self.subscriptions[sub_id] = chan_id
+        self.subscriptions_by_channel[chan_id].add(sub_id)
 
     def remove_subscription(
         self, removed_sub_id: SubscriptionId
     ) -> Optional[ChannelId]:
-        chan_id = self.subscriptions.get(removed_sub_id)
+        chan_id = self.subscriptions.pop(removed_sub_id, None)
         if chan_id is None:
             return None
-        self.subscriptions = MappingProxyType(
-            {
-                sub: chan
-                for sub, chan in self.subscriptions.items()
-                if sub != removed_sub_id
-            }
-        )
-        new_subscriptions_by_channel = {
-            chan: subs
-            for chan, subs in self.subscriptions_by_channel.items()
-            if chan != chan_id
-        }
-        new_subs = {
-            sub_id
-            for sub_id in self.subscriptions_by_channel.get(chan_id, ())
-            if sub_id != removed_sub_id
-        }
-        if new_subs:
-            new_subscriptions_by_channel[chan_id] = new_subs
-        self.subscriptions_by_channel = MappingProxyType(new_subscriptions_by_channel)
-
+        subs = self.subscriptions_by_channel[chan_id]
+        subs.discard(removed_sub_id)
+        if not subs:
+            del self.subscriptions_by_channel[chan_id]
         return chan_id
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import signal
+import sys
+from typing import Any, Iterator, List
+
+import pytest
+
+import foxglove_websocket
+from foxglove_websocket import run_cancellable
+
+
+@pytest.fixture(params=["asyncio", "uvloop"])
+def event_loop_impl(request: Any, monkeypatch: pytest.MonkeyPatch):
+    """
+    Run each test with the standard asyncio event loop, and with uvloop if it is installed.
+    """
+    if request.param == "asyncio":
+        monkeypatch.setattr(foxglove_websocket, "uvloop", None)
+    elif foxglove_websocket.uvloop is None:
+        pytest.skip("uvloop is not installed")
+    return request.param
+
+
+@pytest.fixture
+def sigint_handler() -> Iterator[None]:
+    """
+    Restore the original SIGINT handler after a test that replaces it.
+    """
+    original = signal.getsignal(signal.SIGINT)
+    yield
+    signal.signal(signal.SIGINT, original)
+
+
+def test_return_value(event_loop_impl: str):
+    async def main():
+        await asyncio.sleep(0)
+        return 42
+
+    assert run_cancellable(main()) == 42
+
+
+@pytest.mark.skipif(
+    sys.platform == "win32", reason="signal handlers are not available on Windows"
+)
+def test_sigint_cancels(event_loop_impl: str, sigint_handler: None):
+    events: List[str] = []
+
+    async def main():
+        asyncio.get_running_loop().call_soon(os.kill, os.getpid(), signal.SIGINT)
+        try:
+            await asyncio.sleep(10)
+            events.append("finished")
+        except asyncio.CancelledError:
+            events.append("cancelled")
+            raise
+        finally:
+            events.append("cleanup")
+
+    assert run_cancellable(main()) is None
+    assert events == ["cancelled", "cleanup"]
@@ -3,16 +3,24 @@ import json
 import logging
 import pytest
 from socket import AddressFamily
-from typing import List, Tuple
-from websockets.client import connect
+from typing import List, Optional, Tuple
+from websockets.client import connect, WebSocketClientProtocol
 from websockets.server import WebSocketServer
 
+import foxglove_websocket.server
 from foxglove_websocket.server import (
     FoxgloveServer,
     FoxgloveServerListener,
     MessageDataHeader,
+    _decode_json,
+    _encode_json,
+)
+from foxglove_websocket.types import (
+    BinaryOpcode,
+    ChannelId,
+    ChannelWithoutId,
+    StatusLevel,
 )
-from foxglove_websocket.types import BinaryOpcode, ChannelId, ChannelWithoutId
 
 
 def get_server_url(server: WebSocketServer):
@@ -54,6 +62,19 @@ async def test_shutdown_after_startup():
     await server.wait_closed()
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("compression", ["deflate", None])
+async def test_compression(compression: Optional[str]):
+    async with FoxgloveServer(
+        "localhost", None, "test server", compression=compression
+    ) as server:
+        async with connect(get_server_url(await server.wait_opened())) as ws:
+            assert json.loads(await ws.recv())["op"] == "serverInfo"
+            assert [ext.name for ext in ws.extensions] == (
+                ["permessage-deflate"] if compression else []
+            )
+
+
 @pytest.mark.asyncio
 async def test_warn_invalid_channel():
     async with FoxgloveServer("localhost", None, "test server") as server:
@@ -75,6 +96,72 @@ async def test_warn_invalid_channel():
             }
 
 
+@pytest.mark.asyncio
+async def test_coalesce_subscription_status():
+    async with FoxgloveServer("localhost", None, "test server") as server:
+        chan_id = await server.add_channel(
+            {
+                "topic": "t",
+                "encoding": "e",
+                "schemaName": "S",
+                "schema": "s",
+            }
+        )
+        async with connect(get_server_url(await server.wait_opened())) as ws:
+            assert json.loads(await ws.recv())["op"] == "serverInfo"
+            assert json.loads(await ws.recv())["op"] == "advertise"
+            await ws.send(
+                json.dumps(
+                    {
+                        "op": "subscribe",
+                        "subscriptions": [
+                            {"id": 1, "channelId": chan_id},
+                            {"id": 1, "channelId": chan_id},
+                            {"id": 2, "channelId": 998},
+                            {"id": 3, "channelId": 999},
+                        ],
+                    }
+                )
+            )
+            assert json.loads(await ws.recv()) == {
+                "op": "status",
+                "level": 2,
+                "message": "Client subscription id 1 was already used; ignoring subscription",
+            }
+            assert json.loads(await ws.recv()) == {
+                "op": "status",
+                "level": 1,
+                "message": "Channel 998 is not available; ignoring subscription\n"
+                "Channel 999 is not available; ignoring subscription",
+            }
+
+
+@pytest.mark.asyncio
+async def test_subscription_status_before_error():
+    async with FoxgloveServer("localhost", None, "test server") as server:
+        async with connect(get_server_url(await server.wait_opened())) as ws:
+            assert json.loads(await ws.recv())["op"] == "serverInfo"
+            assert json.loads(await ws.recv())["op"] == "advertise"
+            await ws.send(
+                json.dumps(
+                    {
+                        "op": "subscribe",
+                        "subscriptions": [{"id": 1, "channelId": 999}, {"id": 2}],
+                    }
+                )
+            )
+            assert json.loads(await ws.recv()) == {
+                "op": "status",
+                "level": 1,
+                "message": "Channel 999 is not available; ignoring subscription",
+            }
+            assert json.loads(await ws.recv()) == {
+                "op": "status",
+                "level": 2,
+                "message": "KeyError: 'channelId'",
+            }
+
+
 @pytest.mark.asyncio
 async def test_disconnect_during_send(caplog: pytest.LogCaptureFixture):
     async with FoxgloveServer("localhost", None, "test server") as server:
@@ -186,6 +273,38 @@ async def test_update_channels():
             }
 
 
+@pytest.mark.asyncio
+async def test_initial_advertise_after_channel_updates():
+    async with FoxgloveServer("localhost", None, "test server") as server:
+        url = get_server_url(await server.wait_opened())
+        channel: ChannelWithoutId = {
+            "topic": "t",
+            "encoding": "e",
+            "schemaName": "S",
+            "schema": "s",
+        }
+
+        async with connect(url) as ws_a:
+            assert json.loads(await ws_a.recv())["op"] == "serverInfo"
+            assert json.loads(await ws_a.recv()) == {"op": "advertise", "channels": []}
+
+            chan_id = await server.add_channel(channel)
+            async with connect(url) as ws_b:
+                assert json.loads(await ws_b.recv())["op"] == "serverInfo"
+                assert json.loads(await ws_b.recv()) == {
+                    "op": "advertise",
+                    "channels": [{**channel, "id": chan_id}],
+                }
+
+            await server.remove_channel(chan_id)
+            async with connect(url) as ws_c:
+                assert json.loads(await ws_c.recv())["op"] == "serverInfo"
+                assert json.loads(await ws_c.recv()) == {
+                    "op": "advertise",
+                    "channels": [],
+                }
+
+
 @pytest.mark.asyncio
 async def test_unsubscribe_during_send():
     subscribed_event = asyncio.Event()
@@ -258,3 +377,198 @@ async def test_unsubscribe_during_send():
                 await ws.recv()
                 == MessageDataHeader.pack(BinaryOpcode.MESSAGE_DATA, 42, 100) + payload
             )
+
+
+@pytest.mark.asyncio
+async def test_send_messages():
+    subscribed_event = asyncio.Event()
+
+    class Listener(FoxgloveServerListener):
+        def on_subscribe(self, server: FoxgloveServer, channel_id: ChannelId):
+            subscribed_event.set()
+
+        def on_unsubscribe(self, server: FoxgloveServer, channel_id: ChannelId):
+            pass
+
+    async with FoxgloveServer("localhost", None, "test server") as server:
+        server.set_listener(Listener())
+        ws_server = await server.wait_opened()
+        channel: ChannelWithoutId = {
+            "topic": "t",
+            "encoding": "e",
+            "schemaName": "S",
+            "schema": "s",
+        }
+        chan_id = await server.add_channel(channel)
+        other_chan_id = await server.add_channel({**channel, "topic": "u"})
+        async with connect(get_server_url(ws_server)) as ws:
+            assert json.loads(await ws.recv())["op"] == "serverInfo"
+            assert json.loads(await ws.recv())["op"] == "advertise"
+
+            await ws.send(
+                json.dumps(
+                    {
+                        "op": "subscribe",
+                        "subscriptions": [{"id": 42, "channelId": chan_id}],
+                    }
+                )
+            )
+            await subscribed_event.wait()
+
+            await server.send_messages(
+                [
+                    (chan_id, 100, b"first"),
+                    (other_chan_id, 150, b"ignored"),
+                    (chan_id, 200, b"second"),
+                ]
+            )
+
+            assert (
+                await ws.recv()
+                == MessageDataHeader.pack(BinaryOpcode.MESSAGE_DATA, 42, 100) + b"first"
+            )
+            assert (
+                await ws.recv()
+                == MessageDataHeader.pack(BinaryOpcode.MESSAGE_DATA, 42, 200)
+                + b"second"
+            )
+
+
+@pytest.mark.asyncio
+async def test_send_message_memoryview():
+    subscribed_event = asyncio.Event()
+
+    class Listener(FoxgloveServerListener):
+        def on_subscribe(self, server: FoxgloveServer, channel_id: ChannelId):
+            subscribed_event.set()
+
+        def on_unsubscribe(self, server: FoxgloveServer, channel_id: ChannelId):
+            pass
+
+    async with FoxgloveServer("localhost", None, "test server") as server:
+        server.set_listener(Listener())
+        ws_server = await server.wait_opened()
+        chan_id = await server.add_channel(
+            {
+                "topic": "t",
+                "encoding": "e",
+                "schemaName": "S",
+                "schema": "s",
+            }
+        )
+        async with connect(get_server_url(ws_server)) as ws:
+            assert json.loads(await ws.recv())["op"] == "serverInfo"
+            assert json.loads(await ws.recv())["op"] == "advertise"
+
+            await ws.send(
+                json.dumps(
+                    {
+                        "op": "subscribe",
+                        "subscriptions": [{"id": 42, "channelId": chan_id}],
+                    }
+                )
+            )
+            await subscribed_event.wait()
+
+            buffer = bytearray(b"--payload--")
+            await server.send_message(chan_id, 100, memoryview(buffer)[2:-2])
+
+            assert (
+                await ws.recv()
+                == MessageDataHeader.pack(BinaryOpcode.MESSAGE_DATA, 42, 100)
+                + b"payload"
+            )
+
+
+@pytest.mark.asyncio
+async def test_listener_callbacks_multiple_clients():
+    listener_calls: List[Tuple[str, ChannelId]] = []
+    listener_called = asyncio.Event()
+
+    class Listener(FoxgloveServerListener):
+        def on_subscribe(self, server: FoxgloveServer, channel_id: ChannelId):
+            listener_calls.append(("subscribe", channel_id))
+            listener_called.set()
+
+        def on_unsubscribe(self, server: FoxgloveServer, channel_id: ChannelId):
+            listener_calls.append(("unsubscribe", channel_id))
+            listener_called.set()
+
+    async def unsubscribe(ws: WebSocketClientProtocol, sub_ids: List[int]):
+        await ws.send(json.dumps({"op": "unsubscribe", "subscriptionIds": sub_ids}))
+        # Unsubscribing from an unknown id replies with a status message, which guarantees that
+        # the server has processed everything sent before it.
+        await ws.send(json.dumps({"op": "unsubscribe", "subscriptionIds": [99]}))
+        assert json.loads(await ws.recv())["op"] == "status"
+
+    async with FoxgloveServer("localhost", None, "test server") as server:
+        server.set_listener(Listener())
+        ws_server = await server.wait_opened()
+        chan_id = await server.add_channel(
+            {
+                "topic": "t",
+                "encoding": "e",
+                "schemaName": "S",
+                "schema": "s",
+            }
+        )
+        subscribe = json.dumps(
+            {
+                "op": "subscribe",
+                "subscriptions": [
+                    {"id": 1, "channelId": chan_id},
+                    {"id": 2, "channelId": chan_id},
+                ],
+            }
+        )
+        async with connect(get_server_url(ws_server)) as ws1:
+            assert json.loads(await ws1.recv())["op"] == "serverInfo"
+            assert json.loads(await ws1.recv())["op"] == "advertise"
+            async with connect(get_server_url(ws_server)) as ws2:
+                assert json.loads(await ws2.recv())["op"] == "serverInfo"
+                assert json.loads(await ws2.recv())["op"] == "advertise"
+
+                await ws1.send(subscribe)
+                await listener_called.wait()
+                listener_called.clear()
+                await ws2.send(subscribe)
+
+                # The second client keeps one of its subscriptions, so the channel stays subscribed
+                # after the first client unsubscribes from everything.
+                await unsubscribe(ws2, [1])
+                await unsubscribe(ws1, [1, 2])
+                assert listener_calls == [("subscribe", chan_id)]
+
+                await server.send_message(chan_id, 100, b"data")
+                assert (
+                    await ws2.recv()
+                    == MessageDataHeader.pack(BinaryOpcode.MESSAGE_DATA, 2, 100)
+                    + b"data"
+                )
+
+            await listener_called.wait()
+            assert listener_calls == [("subscribe", chan_id), ("unsubscribe", chan_id)]
+
+
+@pytest.mark.parametrize("encoder", ["orjson", "json"])
+def test_json_round_trip(encoder: str, monkeypatch: pytest.MonkeyPatch):
+    if encoder == "json":
+        monkeypatch.setattr(foxglove_websocket.server, "orjson", None)
+    elif foxglove_websocket.server.orjson is None:
+        pytest.skip("orjson is not installed")
+
+    encoded = _encode_json(
+        {"op": "status", "level": StatusLevel.WARNING, "message": "Grüße, 世界"}
+    )
+    # Control messages must be sent as text frames.
+    assert isinstance(encoded, str)
+    assert json.loads(encoded) == {
+        "op": "status",
+        "level": 1,
+        "message": "Grüße, 世界",
+    }
+    assert _decode_json(encoded) == {
+        "op": "status",
+        "level": 1,
+        "message": "Grüße, 世界",
+    }